@@ -18,9 +18,10 @@ person becomes immune, either by healing naturally or by dying.
 import networkx as nx
 import numpy as np
 from matplotlib import pyplot as plt
-import random
+import multiprocessing as mp
 from scipy import stats
 from NetworkGeneration import hubs_generate
+import NetworkStore as ns
 import time
 
 #--------------------------------------------------------------------------
@@ -31,6 +32,20 @@ def travel_prob(d, l=a): #probability of someone traveling to a city at distance
                            #d of them, a is just a constant.    
     return np.exp(-l*d)
 
+#purposes of the random numbers of the simulation, each one has its own streams:
+purposes=('contact', 'infect', 'travel', 'heal', 'patient0')
+
+def Stream(seed, purpose, day=0, city_label=0):
+    '''
+    Returns the numpy random generator of the given purpose (one of purposes), day
+    and city. Each combination of (seed, day, city, purpose) has its own stream,
+    so the random numbers used for something never depend on how many numbers
+    were used for something else. This is what makes simulations with the same
+    seed and different parameters use common random numbers.
+    '''
+    
+    return np.random.default_rng([seed, purposes.index(purpose), day, city_label])
+
 def NumberofNeighbors(graph, node_label):
     
     neighbors=[n for n in graph.neighbors(node_label)]
@@ -46,8 +61,10 @@ class Person():
     and where they are in a given moment in time.
     '''
     
-    def __init__(self, home_city, current_city, heal_prob=1/14):
+    def __init__(self, home_city, current_city, heal_prob=1/14, index=0):
         
+        self.index=index #position of the person in the citizens of their home city,
+        #it tells which random numbers of the home city are theirs (see City.new_day)
         self.susceptible=True
         self.infected=False
         self.immune=False
@@ -91,7 +108,7 @@ class Person():
         if self.current_city!=self.home_city:
             self.days_out_home+=1
             
-        if self.infected==True and random.random()<self.heal_prob:
+        if self.infected==True and self.home_city.draws['heal'][self.index]<self.heal_prob:
             self.heal()
             
 class City():
@@ -105,7 +122,7 @@ class City():
         
         self.label=label #label to identify the city
         self.node=node #networkx node of the city
-        self.citizens=[Person(self, self) for i in range(population)] #the city starts with a healthy population
+        self.citizens=[Person(self, self, index=i) for i in range(population)] #the city starts with a healthy population
         #self.citizens is the list of people who live in the city, not including
         #people who traveled to the city, and including people who traveled
         #from the city
@@ -121,6 +138,21 @@ class City():
         
         for citizen in self.citizens:
             self.people_in.append(citizen)
+            
+    def new_day(self, seed, day, avg_contact):
+        '''
+        Draws the random numbers of the citizens of the city for the day, a fixed
+        amount for each citizen, wherever they are: the positions and infection
+        chances of their avg_contact contacts (if they are infected), their place in
+        the line of travelers and their chance of healing. Since the amount never changes,
+        each citizen gets the same numbers for the same seed and day, no matter the
+        parameters of the simulation.
+        '''
+        
+        self.draws={purpose: Stream(seed, purpose, day, self.label).random((self.population, avg_contact))
+                    for purpose in ('contact', 'infect')}
+        self.draws.update({purpose: Stream(seed, purpose, day, self.label).random(self.population)
+                           for purpose in ('travel', 'heal')})
         
     def Internal_infection(self, avg_contact, infection_prob):
         
@@ -128,11 +160,12 @@ class City():
         
         for person in self.people_in: #for each person in the city
             if person.infected==True: #the infected ones will test to see if they will infect someone
+                draws=person.home_city.draws #the random numbers of the person (see new_day)
                 
                 for contact in range(avg_contact): #for each person they get contact with
-                    rindex=random.randint(0, len(self.people_in)-1) #random index
+                    rindex=int(draws['contact'][person.index, contact]*len(self.people_in)) #random index
                     rpatient=self.people_in[rindex] #random patient
-                    if rpatient.susceptible==True and random.random()<infection_prob:
+                    if rpatient.susceptible==True and draws['infect'][person.index, contact]<infection_prob:
                         
                         rpatient.get_infected() #there is a random chance of that contact becoming infected
                         self.cumulative_infected+=1
@@ -153,7 +186,8 @@ class City():
 #----------------------------------------------------------------------------
 
 def Simulation(no_days=90, infection_prob=inf_prob,
-               avg_contact=6, avg_time_trip=4, Npatient0=1):
+               avg_contact=6, avg_time_trip=4, Npatient0=1, city_network=None,
+               travel_decay=a, seed=None, verbose=True):
     '''
     This will make the job of the main function for the simulation. All the 
     parameters have a standard value, but you can change them: no_days is
@@ -161,10 +195,26 @@ def Simulation(no_days=90, infection_prob=inf_prob,
     which a susceptible person, if in contact with an infected person, gets
     infected; avg_contact is the number of contacts a person has during one
     day and avg_time_trip is the limit to which a person can spend outside
-    of their home city.
+    of their home city. If city_network is None, a new network of cities is
+    generated, otherwise the given networkx graph is used (for example a network
+    loaded with NetworkStore.NetworkStore().hubs(m=1, N=3).to_networkx()).
+    travel_decay is the constant of travel_prob (the global a by default). Every
+    day, int(travel_prob*(people in the city)) people travel from each city to
+    each other city, the ones with the smallest travel numbers of the day going
+    first. All the random numbers come from the streams of Stream, made
+    from seed (a random one if seed is None), with a fixed amount of numbers for
+    each person and day (see City.new_day), so two simulations with the same
+    seed and network use common random numbers even with different parameters,
+    and the global random state is not touched. If verbose is False, nothing is
+    printed or drawn.
     '''
                
-    city_network=hubs_generate(m=1, N=3 ,draw=True)
+    if city_network is None:
+        city_network=hubs_generate(m=1, N=3 ,draw=verbose)
+        
+    if seed is None:
+        seed=np.random.SeedSequence().entropy
+
     nodes_list=list(city_network.nodes)
     network_infected_list=[]
         
@@ -191,8 +241,8 @@ def Simulation(no_days=90, infection_prob=inf_prob,
     #between nodes n1 and n2.
          
     #N patients 0 in the central city:
-    for i in range(Npatient0):
-        rindex=random.randint(0, center.population-1) #random index
+    patients0=Stream(seed, 'patient0').integers(0, center.population, Npatient0)
+    for rindex in patients0: #random indexes
         rpatient=center.citizens[rindex] #random patient
         rpatient.get_infected()
         center.cumulative_infected+=1
@@ -205,20 +255,27 @@ def Simulation(no_days=90, infection_prob=inf_prob,
     #time simulation:
     for day in range(no_days):
         daily_infected=0 #new people infected in a given day
+        
+        for city in cities_list:
+            city.new_day(seed, day, avg_contact)
             
         for city in cities_list:
             new_inf=city.Internal_infection(avg_contact, infection_prob) #processes the internal infection before trips
             daily_infected+=new_inf
             
+            #the people in the city in the order they are picked to travel:
+            line=sorted(city.people_in, key=lambda person: person.home_city.draws['travel'][person.index])
+            picked=0
+            
             for destination in cities_list:
                 
                 if distances[city.node][destination.node]!=0:
                         
-                    travelers=int(travel_prob(d=distances[city.node][destination.node])*len(city.people_in))
+                    travelers=int(travel_prob(d=distances[city.node][destination.node], l=travel_decay)*len(city.people_in))
                         
-                    for i in range(travelers):
-                        rtraveler=random.choice(city.people_in)
+                    for rtraveler in line[picked:picked+travelers]:
                         rtraveler.travel(destination)
+                    picked+=travelers
             
         network_infected=0             
         for city in cities_list:            
@@ -231,7 +288,8 @@ def Simulation(no_days=90, infection_prob=inf_prob,
 
         daily_list.append(daily_infected)                
         network_infected_list.append(network_infected)
-        print('Day ', day+1, ' simulated!')
+        if verbose:
+            print('Day ', day+1, ' simulated!')
         
     return cities_list, no_days, network_infected_list, daily_list
                     
@@ -312,17 +370,102 @@ def Analyse_data(simulation_data,
             plt.savefig('daily_cases.png')
             
 # -----------------------------------------------------------------------
+
+def Summarize_simulation(simulation_data):
+    '''
+    Reduces the result of the Simulation function to a few numbers: the day with
+    the most (non-cumulative) infected people, the final size of the epidemic
+    (total number of people infected, and the fraction of the population) and the
+    slope of the log-log plot of Analyse_data (log of the cumulative infected
+    against log of the population of the cities), which is nan if fewer than two
+    cities had infections.
+    '''
+    
+    cities_list, days, infected_list, daily_list=simulation_data
+    
+    infected=[city for city in cities_list if city.cumulative_infected!=0]
+    final_size=sum(city.cumulative_infected for city in cities_list)
+    population=sum(city.population for city in cities_list)
+    
+    if len(infected)>1:
+        slope=stats.linregress([np.log(city.population) for city in infected],
+                               [np.log(city.cumulative_infected) for city in infected])[0]
+    else:
+        slope=np.nan
+    
+    return {'peak_day': int(np.argmax(infected_list))+1, 'final_size': final_size,
+            'attack_rate': final_size/population, 'slope': slope}
+
+def Sweep_point(travel_decay, infection_prob, seed, network_params, store_path, simulation_kwargs):
+    '''
+    Worker of Parameter_sweep: runs one realization at one point of the grid. The
+    network of cities and the random numbers of the epidemic only depend on the
+    seed (see Stream), so every point of the grid with the same seed sees the same
+    network and uses the same random numbers (common random numbers).
+    '''
+    
+    if store_path is not None:
+        city_network=ns.NetworkStore(store_path).hubs(seed=seed, **network_params).to_networkx()
+    else:
+        ns.seed_generators(seed)
+        city_network=hubs_generate(**network_params)
+        
+    simulation=Simulation(infection_prob=infection_prob, city_network=city_network,
+                          travel_decay=travel_decay, seed=seed, verbose=False,
+                          **simulation_kwargs)
+    
+    return Summarize_simulation(simulation)
+
+def Parameter_sweep(a_list, inf_prob_list, realizations=10, network_params=None,
+                    store_path=None, processes=None, **simulation_kwargs):
+    '''
+    Runs the simulation for every pair (a, inf_prob) of the grid made by a_list (the
+    travel decay of travel_prob) and inf_prob_list (infection probabilities), with
+    the given number of realizations each, using a pool of processes (all cores
+    by default). Realization k uses seed k at every point of the grid (see
+    Sweep_point), so the differences between points come from the parameters and
+    not from the noise, and comparing the points realization by realization
+    (paired differences) needs a lot fewer realizations than independent runs.
+    network_params are the arguments of hubs_generate ({'m': 1, 'N': 3} by
+    default, like in Simulation; the networks are kept in the network store in
+    store_path, if given) and simulation_kwargs go to Simulation (no_days,
+    avg_contact, Npatient0...). Returns a dict where
+    results[(a, inf_prob)] is a dict with the arrays (one value per realization,
+    in the order of the seeds) of every summary of Summarize_simulation.
+    '''
+    
+    if network_params is None:
+        network_params={'m': 1, 'N': 3}
+    
+    with mp.Pool(processes=processes) as pool:
+        pool_dict={}
+        
+        for seed in range(realizations):
+            for travel_decay in a_list:
+                for infection_prob in inf_prob_list:
+                    pool_dict[(travel_decay, infection_prob, seed)]=pool.apply_async(Sweep_point, 
+                             (travel_decay, infection_prob, seed, network_params, store_path, simulation_kwargs))
+        
+        results={}
+        
+        for travel_decay in a_list:
+            for infection_prob in inf_prob_list:
+                summaries=[pool_dict[(travel_decay, infection_prob, seed)].get() for seed in range(realizations)]
+                results[(travel_decay, infection_prob)]={name: np.array([summary[name] for summary in summaries])
+                                                         for name in summaries[0]}
+    
+    return results
+
+# -----------------------------------------------------------------------
             
 def main():   
     simulation=Simulation()
     Analyse_data(simulation_data=simulation)
 
-start_time=time.time()
-
 if __name__=='__main__':
+    start_time=time.time()
     main()   
-    
-print('Execution time: %s seconds' % (time.time() - start_time))
+    print('Execution time: %s seconds' % (time.time() - start_time))
                     
 '''
 The code is working, but the results are not exactly the ones expected.
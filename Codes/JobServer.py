@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is a small local job server for the simulations of this repo. It
+keeps a pool of warm workers (with all the modules already imported and the
+networks they load kept in memory), so the exploration from a notebook or the
+terminal doesn't pay the cost of starting a new pool, importing everything and
+generating the networks again at every call. The server listens on a Unix socket
+in a private folder of the user (or on localhost, where Unix sockets are not
+available) and only accepts clients that know the user's secret key (see
+authkey; the messages are pickles, so anyone with the key can run code as the
+user). It accepts TN ensemble and epidemic jobs from any number of clients and
+streams the partial results back as soon as each task is done. To start the
+server, run this file; then, from anywhere:
+
+    import JobServer as js
+    client=js.JobClient()
+    for labels, energies in client.stream({'kind': 'TN', 'n': 1000, 'alpha_A': 2, 'alpha_G': 1, 'N': 100}):
+        ...
+"""
+
+import os
+import sys
+import queue
+import random
+import socket
+import threading
+import traceback
+import collections
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client, AuthenticationError
+import numpy as np
+import NetworkStore as ns
+import NetworkStatistics as nst
+import TN_analyseMP as tn
+import CitiesInfection as ci
+
+#private folder of the user for the socket and the key (only the user can open it):
+runtime_dir=os.path.join(os.environ.get('XDG_RUNTIME_DIR') or os.path.expanduser('~'), '.fractal_jobs')
+
+#default address: a Unix socket if the system has them, otherwise a port on localhost
+if hasattr(socket, 'AF_UNIX'):
+    default_address=os.path.join(runtime_dir, 'jobs.sock')
+else:
+    default_address=('localhost', 6000)
+
+max_networks=64 #networks kept loaded by each worker
+
+def authkey():
+    '''
+    Returns the secret key of the user, shared by the server and the clients. It
+    is created (32 random bytes from os.urandom) the first time, in a file that
+    only the user can read, inside runtime_dir.
+    '''
+
+    os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+    os.chmod(runtime_dir, 0o700)
+    path=os.path.join(runtime_dir, 'authkey')
+
+    try:
+        descriptor=os.open(path, os.O_WRONLY|os.O_CREAT|os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, 'rb') as file:
+            return file.read()
+
+    key=os.urandom(32)
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(key)
+
+    return key
+
+def server_running(address, key):
+    #True if something answers on address (a server, ours or not)
+
+    try:
+        with Client(address, authkey=key) as connection:
+            connection.send({'kind': 'ping'})
+            connection.recv()
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+    except (AuthenticationError, EOFError, OSError):
+        return True
+
+    return True
+
+#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#
+
+_networks=collections.OrderedDict() #networks already loaded by this worker, by key
+
+def cached_network(store_path, model, seed, **params):
+    '''
+    Returns the network of the store in store_path with the given model, seed and
+    parameters, loading it (memory mapped) only the first time the worker needs
+    it. The networks stay loaded for the next jobs, up to max_networks of them
+    (the least recently used ones are dropped first).
+    '''
+
+    key=(store_path, ns.network_key(model, seed, **params))
+
+    return remember(key, lambda: getattr(ns.NetworkStore(store_path), model)(seed=seed, **params))
+
+def remember(key, load):
+    #returns _networks[key], calling load() first if it's not there
+
+    if key in _networks:
+        _networks.move_to_end(key)
+    else:
+        _networks[key]=load()
+        if len(_networks)>max_networks:
+            _networks.popitem(last=False)
+
+    return _networks[key]
+
+def cached_city_network(store_path, seed, **params):
+    #same as cached_network, for the networkx graphs used by CitiesInfection
+
+    key=(store_path, ns.network_key('hubs', seed, **params), 'networkx')
+
+    return remember(key, lambda: cached_network(store_path, 'hubs', seed, **params).to_networkx())
+
+def preload(networks):
+    '''
+    Initializer of the workers: loads the networks in the list networks, each one
+    a dict with the arguments of cached_network (store_path, model, seed and the
+    parameters), so the first jobs that use them are already fast.
+    '''
+
+    for network in networks:
+        cached_network(**network)
+
+def stored_TN_energies(store_path, seed, params):
+    #energies of a stored TN network, as a (1, N) array
+
+    return np.array(cached_network(store_path, 'TN', seed, **params).energies)[None,:]
+
+def stored_TN_statistics(store_path, seed, params):
+    #same as TN_analyseMP.realization_statistics, but the network stays loaded
+
+    network=cached_network(store_path, 'TN', seed, **params)
+
+    return np.array(network.energies), nst.stored_statistics(network)
+
+def epidemic_task(travel_decay, infection_prob, seed, network_params, store_path, simulation_kwargs):
+    #same as CitiesInfection.Sweep_point, but the network of cities stays loaded
+
+    city_network=cached_city_network(store_path, seed, **network_params)
+    simulation=ci.Simulation(infection_prob=infection_prob, city_network=city_network,
+                             travel_decay=travel_decay, seed=seed, verbose=False,
+                             **simulation_kwargs)
+
+    return ci.Summarize_simulation(simulation)
+
+#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#
+
+def job_tasks(job):
+    '''
+    Splits a job (a dict) in the tasks that go to the pool, returned as a list of
+    (label, function, args). The kinds of job are:
+    - 'TN': n realizations of the TN model with the parameters alpha_A, alpha_G, N
+    and, optionally, m and d. If store_path is given, realization i is the stored
+    network with seed i (loaded once per worker), otherwise the realizations are
+    generated in batches of batch networks (100 by default) with seeds starting at
+    seed (random by default). The result of each task is a (R, N) array of energies.
+    - 'TN_statistics': same parameters, but each task is one realization and its
+    result is (energies, NetworkSummary) (see TN_analyseMP.simular_estatisticas).
+    - 'epidemic': a grid a_list x inf_prob_list with the given number of
+    realizations, like CitiesInfection.Parameter_sweep (with network_params,
+    store_path and simulation, the dict with the arguments of Simulation). The
+    result of each task is the Summarize_simulation dict of one realization.
+    The label of each task says which realizations (or grid point) it is.
+    '''
+
+    kind=job['kind']
+    store_path=job.get('store_path')
+    params={name: job[name] for name in ('alpha_A', 'alpha_G', 'N', 'm', 'd') if name in job}
+    tasks=[]
+
+    if kind=='TN' and store_path is not None:
+        for i in range(job['n']):
+            tasks.append(((i,), stored_TN_energies, (store_path, i, params)))
+
+    elif kind=='TN':
+        batch=job.get('batch', 100)
+        seed=job.get('seed', random.randrange(2**32))
+        for start in range(0, job['n'], batch):
+            R=min(batch, job['n']-start)
+            tasks.append((tuple(range(start, start+R)), tn.TN_batch_energies,
+                          (params['alpha_A'], params['alpha_G'], params['N'], R, seed+start,
+                           params.get('m', 1), params.get('d', 2))))
+
+    elif kind=='TN_statistics' and store_path is not None:
+        for i in range(job['n']):
+            tasks.append(((i,), stored_TN_statistics, (store_path, i, params)))
+
+    elif kind=='TN_statistics':
+        for i in range(job['n']):
+            tasks.append(((i,), tn.realization_statistics, ('TN', params, random.randrange(2**32))))
+
+    elif kind=='epidemic':
+        network_params=job.get('network_params', {'m': 1, 'N': 3})
+        for seed in range(job.get('realizations', 10)):
+            for travel_decay in job['a_list']:
+                for infection_prob in job['inf_prob_list']:
+                    tasks.append(((travel_decay, infection_prob, seed), epidemic_task,
+                                  (travel_decay, infection_prob, seed, network_params,
+                                   store_path if store_path is not None else ns.store_path,
+                                   job.get('simulation', {}))))
+
+    else:
+        raise ValueError('Unknown kind of job: '+str(kind))
+
+    return tasks
+
+class JobServer:
+    '''
+    The server itself: a warm pool of processes (all cores by default, with the
+    networks in preload already loaded, see preload) and a Listener on address.
+    Each client connection is handled by a thread, which splits the job in tasks,
+    puts them in the queue of the pool (at most two per process at a time, so a
+    big job doesn't block the others and a failed job stops right away) and
+    sends every result back, as a message ('partial', label, result), as soon as
+    it is ready, finishing with ('done', number of tasks) or ('error', traceback).
+    A job {'kind': 'ping'} just answers ('done', 0) and {'kind': 'shutdown'} stops
+    the server. key is the secret of the clients (the user's authkey by default).
+    '''
+
+    def __init__(self, address=default_address, key=None, processes=None, preload_networks=()):
+
+        self.address=address
+        self.authkey=authkey() if key is None else key
+        self.processes=processes or mp.cpu_count()
+        self.pool=mp.Pool(processes=self.processes, initializer=preload, initargs=(list(preload_networks),))
+        self.running=False
+
+    def handle(self, connection):
+
+        try:
+            job=connection.recv()
+
+            if job['kind']=='ping':
+                connection.send(('done', 0))
+                return
+
+            if job['kind']=='shutdown':
+                self.running=False
+                connection.send(('done', 0))
+                Client(self.address, authkey=self.authkey).close() #wakes up the accept of serve
+                return
+
+            tasks=job_tasks(job)
+            results=queue.Queue()
+            waiting=iter(tasks)
+
+            def submit(): #puts the next task of the job in the pool
+                for label, function, args in waiting:
+                    self.pool.apply_async(function, args,
+                                          callback=lambda result, label=label: results.put(('partial', label, result)),
+                                          error_callback=lambda error: results.put(('error', error, None)))
+                    return
+
+            for i in range(min(2*self.processes, len(tasks))):
+                submit()
+
+            for i in range(len(tasks)):
+                message=results.get()
+                if message[0]=='error': #the tasks not submitted yet are dropped
+                    error=message[1]
+                    connection.send(('error', ''.join(traceback.format_exception(type(error), error, error.__traceback__))))
+                    return
+                connection.send(message)
+                submit()
+
+            connection.send(('done', len(tasks)))
+
+        except (EOFError, BrokenPipeError, ConnectionResetError): #the client went away
+            pass
+
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+
+        finally:
+            connection.close()
+
+    def serve(self):
+        '''
+        Accepts connections until a shutdown job arrives. If a server already
+        answers on address, this one refuses to start; if address is the path of a
+        Unix socket left by an old server that is not running any more, it is
+        removed first.
+        '''
+
+        if server_running(self.address, self.authkey):
+            self.pool.terminate()
+            raise RuntimeError('There is already a server on '+str(self.address))
+
+        if isinstance(self.address, str):
+            os.makedirs(os.path.dirname(self.address), mode=0o700, exist_ok=True)
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+        self.running=True
+
+        with Listener(self.address, authkey=self.authkey) as listener:
+            while self.running:
+                try:
+                    connection=listener.accept()
+                except Exception: #failed authentication, for example
+                    continue
+                if not self.running:
+                    connection.close()
+                    break
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+        self.pool.close()
+        self.pool.join()
+
+class JobClient:
+    '''
+    Client of the JobServer. stream(job) yields the (label, result) pairs of the
+    job as they arrive (not in order), and run(job) waits for the whole job and
+    returns the list of (label, result) sorted by label. key is the secret shared
+    with the server (the user's authkey by default).
+    '''
+
+    def __init__(self, address=default_address, key=None):
+
+        self.address=address
+        self.authkey=authkey() if key is None else key
+
+    def stream(self, job):
+
+        with Client(self.address, authkey=self.authkey) as connection:
+            connection.send(job)
+
+            while True:
+                message=connection.recv()
+
+                if message[0]=='partial':
+                    yield message[1], message[2]
+                elif message[0]=='done':
+                    return
+                else:
+                    raise RuntimeError('The job failed in the server:\n'+message[1])
+
+    def run(self, job):
+
+        return sorted(self.stream(job), key=lambda pair: pair[0])
+
+    def ping(self):
+
+        return list(self.stream({'kind': 'ping'}))==[]
+
+    def shutdown(self):
+
+        list(self.stream({'kind': 'shutdown'}))
+
+#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#
+
+if __name__=='__main__':
+    #python3 JobServer.py [socket path or port]
+    if len(sys.argv)>1:
+        address=('localhost', int(sys.argv[1])) if sys.argv[1].isdigit() else sys.argv[1]
+    else:
+        address=default_address
+
+    print('Serving on', address)
+    JobServer(address).serve()
@@ -22,6 +22,14 @@ def hubs_generate(p=0.7,m=3,N=2, draw=False, save=False):
     algorithm and N is the number of interations (recommended 0<N<4). If draw is
     set to True by the user, the function will print the network. If save is set
     to True by the user, it saves a .png image of the network.
+    Since the network is built by inverse renormalization (each node of an
+    iteration becomes the center of a box of the next one), the function also
+    records, in nk.graph, the generation (iteration when it was created, 0 for
+    the starting star) and the parent (node that created it) of every node, and
+    the ancestors table (see hubs_ancestors), as integer arrays indexed by node
+    label-1, with the values also given as label-1. With them, the boxes and the
+    box counting at every scale come directly from the generation (see
+    hubs_box_counts), without a box covering algorithm.
     '''
     
     if save==True: #if save is true and draw is false, problems would happen
@@ -36,6 +44,8 @@ def hubs_generate(p=0.7,m=3,N=2, draw=False, save=False):
     nk.add_edge(1,4)
 
     c=1 #counter
+    parent=[0, 1, 2, 3] #the nodes of the starting star are their own parents
+    generation=[0, 0, 0, 0]
 
     for i in range(N): #starts the generation: N iterations
         #first step
@@ -55,6 +65,8 @@ def hubs_generate(p=0.7,m=3,N=2, draw=False, save=False):
             for j in range(m*nk.degree(node)):
                 nk.add_edge(node, 4+c)
                 new_nodes.append(4+c)
+                parent.append(node-1)
+                generation.append(i+1)
                 c+=1
     
         for edge in old_edges:
@@ -64,6 +76,10 @@ def hubs_generate(p=0.7,m=3,N=2, draw=False, save=False):
                 nk.remove_edge(edge[0], edge[1]) 
                 nk.add_edge(random.choice(list(nk.adj[edge[0]])), random.choice(list(nk.adj[edge[1]]))) #adiciona uma aresta entre o nó e um vértice novo
     
+    nk.graph['parent']=np.array(parent, dtype=np.int32)
+    nk.graph['generation']=np.array(generation, dtype=np.int32)
+    nk.graph['ancestors']=hubs_ancestors(nk.graph['parent'], nk.graph['generation'])
+    
     if draw==True:
         nx.draw(nk, show_labels=True, node_size=12)
         
@@ -72,6 +88,66 @@ def hubs_generate(p=0.7,m=3,N=2, draw=False, save=False):
         
     return nk
 
+def hubs_ancestors(parent, generation):
+    '''
+    Given the parent and generation arrays of a hubs_generate network, returns the
+    (N+1, n) array ancestors, N being the number of iterations and n the number of
+    nodes, where ancestors[g][i] is the node of generation g or older from which
+    node i descends (node i itself if it is that old). The nodes with the same
+    ancestors[g] form one box of the renormalized network of generation g, so each
+    row is the box partition of one scale. Each row is obtained from the next one
+    in one vectorized step, since the parent of a node of generation g+1 is at
+    most of generation g, so the whole table costs O(n) per generation.
+    '''
+    
+    N=int(generation.max())
+    ancestors=np.empty((N+1, len(parent)), dtype=np.int32)
+    ancestors[N]=np.arange(len(parent))
+    
+    for g in range(N-1, -1, -1):
+        older=ancestors[g+1]
+        ancestors[g]=np.where(generation[older]>g, parent[older], older)
+        
+    return ancestors
+
+def hubs_box_counts(generation, length_factor=3):
+    '''
+    Box counting of a hubs_generate network from its generation array, in O(n):
+    the boxes of scale s are the descendants of each node of generation N-s, so
+    their number N_B(s) is the number of nodes of generation N-s or older. Returns
+    the box sizes l_B(s)=length_factor^s and N_B(s) for s=0 (one box per node) to
+    N (one box per node of the starting star). N_B(s) is exact for the boxes of
+    the renormalization, while l_B follows the length scaling of the model: every
+    iteration multiplies the distances between old nodes by 3 when their edges
+    are rewired (probability 1-p), which is the fractal case (p=0); for other
+    values of p you can pass another length_factor.
+    '''
+    
+    N=int(generation.max())
+    existing=np.cumsum(np.bincount(generation, minlength=N+1)) #nodes of generation g or older
+    
+    return length_factor**np.arange(N+1, dtype=np.float64), existing[::-1]
+
+def hubs_box_dimension(generation, length_factor=3):
+    '''
+    Box dimension of a hubs_generate network from N_B(l_B)~l_B^(-d_B), using the
+    box counts of hubs_box_counts. Returns the d_B fitted over all the scales and
+    the local d_B between each pair of consecutive scales. For p=0 it should
+    approach ln(2m+1)/ln(3), the value of the model, which makes it a ground
+    truth to validate general box covering estimators of the fractal dimension.
+    The network needs at least one iteration (N>=1), so there are two scales.
+    '''
+    
+    sizes, counts=hubs_box_counts(generation, length_factor)
+    
+    if len(sizes)<2:
+        raise ValueError('The box dimension needs at least two scales (N>=1)')
+    
+    local=-np.diff(np.log(counts))/np.diff(np.log(sizes))
+    fitted=-np.polyfit(np.log(sizes), np.log(counts), 1)[0]
+    
+    return fitted, local
+
 #---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#---#
 
 class Geo_Node:
@@ -86,18 +162,19 @@ class Geo_Node:
     
     def __init__(self, position, label, weight=1.0):
         '''
-        The position has to be any 2 valued (x,y) set (a tuple, a list, whatever) 
-        containing the x and y component of the position of the node. Maybe
-        in the future I can work with z components. The weight of the node
-        is set to 1 (in case your network in unweighted), otherwise you can
-        set a weight yourself.
+        The position has to be any set (a tuple, a list, whatever) with the
+        components of the position of the node, (x,y) in 2 dimensions, (x,y,z)
+        in 3 dimensions and so on (in 1 dimension, y is taken as 0). The x and y
+        attributes are the first two components, used to draw the network. The
+        weight of the node is set to 1 (in case your network in unweighted),
+        otherwise you can set a weight yourself.
         '''
         
         self.label=label #every node has a label to distinguish it from the others,
         #it can be a number for example.
-        self.x=position[0]
-        self.y=position[1]
-        self.position=(self.x, self.y)
+        self.position=tuple(position)
+        self.x=self.position[0]
+        self.y=self.position[1] if len(self.position)>1 else 0
         self.weight=weight
         self.neighbours=[] #this list contains all the neighbours of the node, 
         #every node that is directly connected to it.
@@ -149,16 +226,7 @@ class Geo_Network:
                 if tup[1] not in self.nodes:
                     self.nodes.append(tup[1])
                     
-            xsum=0
-            ysum=0
-            weight_sum=0
-        
-            for node in self.nodes:
-                xsum+=node.weight*node.x
-                ysum+=node.y*node.weight
-                weight_sum+=node.weight
-            
-            self.center_mass=(xsum/weight_sum, ysum/weight_sum)
+            self.update_center()
                     
         else:
             self.nodes=[]
@@ -191,22 +259,17 @@ class Geo_Network:
     def euclid_distance(self, node1, node2):
         #calculate the euclidean distance between node1 and node2
         
-        distance=((node1.x-node2.x)**2+(node1.y-node2.y)**2)**0.5
+        distance=sum((c1-c2)**2 for c1, c2 in zip(node1.position, node2.position))**0.5
         
         return distance
     
     def update_center(self):
-        #update the center of mass of the network
-        xsum=0
-        ysum=0
-        weight_sum=0
-        
-        for node in self.nodes:
-            xsum+=node.weight*node.x
-            ysum+=node.weight*node.y
-            weight_sum+=node.weight
+        #update the center of mass of the network (with as many components as
+        #the positions of the nodes)
+        weight_sum=sum(node.weight for node in self.nodes)
+        components=zip(*[[node.weight*c for c in node.position] for node in self.nodes])
             
-        self.center_mass=(xsum/weight_sum, ysum/weight_sum)      
+        self.center_mass=tuple(sum(component)/weight_sum for component in components)
         
 def print_Geo_Network(nk, title='My Network', save=False):
     '''
@@ -282,67 +345,210 @@ class alpha_G_prob(rv_continuous):
     
 alpha_dist=alpha_G_prob(name='alpha_dist', a=1)
    
-def TN_model_generate(alpha_A, alpha_G, N):
+def pareto_rvs(alpha_G, d, size, rng):
+    '''
+    Same distribution as alpha_dist.rvs(alpha_G, d), P(r)=(d+alpha_G-1)/r^(d+alpha_G)
+    for r>=1, which is a Pareto distribution, but sampled directly with numpy
+    (rng is a numpy Generator), which is much faster than the numerical inversion
+    done by rv_continuous.
+    '''
     
+    return 1+rng.pareto(d+alpha_G-1, size)
+
+def stretched_exponential_rvs(size, rng):
     '''
-    This function will create a network based on a network model presented by 
-    Constantino Tsallis in the paper available in the references text. The model
-    is still unamed, so I named it for the purposes of this code as Tsallis Network
-    model (explaining why TN_model). The parameters alpha are, obviously, the same
-    alphas from the article used as reference and N is the number of iterations.
-    The dimension, for now, will be always 2 for simplicity.
+    Same distribution as stretched_exponential.rvs(), but sampled directly: if X
+    follows a gamma distribution with shape 1/eta, w0*X^(1/eta) follows equation 3
+    of the article.
     '''
     
-    nk=Geo_Network()
-    node1=Geo_Node((0,0), 1)
-    nk.add_node(node1)
-    nk.update_center()
+    return w0*rng.gamma(1/eta, size=size)**(1/eta)
+
+def edges_to_csr(n, heads, tails, weights=None):
+    '''
+    Builds the CSR arrays (indptr, indices, data) of an undirected network with n
+    nodes, given the arrays heads and tails of the edges (node indexes from 0 to
+    n-1). Every edge is stored in both directions, except for self loops, which
+    are stored only once. The neighbours of node i are indices[indptr[i]:indptr[i+1]]
+    and data holds the weight of each of those connections (1 if weights is None).
+    '''
+
+    heads=np.asarray(heads, dtype=np.int64)
+    tails=np.asarray(tails, dtype=np.int64)
+
+    if weights is None:
+        weights=np.ones(len(heads))
+
+    weights=np.asarray(weights, dtype=np.float64)
+    back=heads!=tails #the reverse direction of self loops is not repeated
+
+    rows=np.concatenate((heads, tails[back]))
+    cols=np.concatenate((tails, heads[back]))
+    data=np.concatenate((weights, weights[back]))
+
+    order=np.lexsort((cols, rows))
+    indptr=np.zeros(n+1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+    return indptr, cols[order].astype(np.int32), data[order]
+
+def weighted_choice(weights, u):
+    '''
+    Chooses len(u) different indexes of the array weights, with probabilities
+    proportional to the weights and without replacement, using the uniform numbers
+    u (in [0,1)): each draw looks for u*total in the cumulative weights, and the
+    weight of the chosen index is set to 0 before the next draw.
+    '''
     
-    r=alpha_dist.rvs(alpha_G, 2) #take a look at the pareto variate prob
-    #distribution to understand why I'm using it, I'm also assuming the module
-    #uses xm=1 to be compatible with the r>=1 of the article.
-    o=random.uniform(0, 2*np.pi) #Here I'm randomly choosing the angular position
-    node2_x=nk.center_mass[0]+r*np.cos(o) #of the 2nd node, since it is apparently 
-    node2_y=nk.center_mass[1]+r*np.sin(o) #arbitrary
+    weights=np.array(weights, dtype=np.float64)
+    chosen=np.empty(len(u), dtype=np.int64)
     
-    node2=Geo_Node((node2_x, node2_y), 1)
-    nk.add_node(node2)
-    edge12_weight=stretched_exponential.rvs()
+    for k in range(len(u)):
+        cumulative=np.cumsum(weights)
+        chosen[k]=min(np.searchsorted(cumulative, u[k]*cumulative[-1], side='right'), len(weights)-1)
+        weights[chosen[k]]=0
+        
+    return chosen
+
+def TN_arrays_generate(alpha_A, alpha_G, N, m=1, d=2, seed=None):
+    '''
+    Generates a network of the TN model (see TN_model_generate) in d dimensions
+    directly on numpy arrays, which is much faster than working with Geo_Node
+    objects. Every new node is placed at a distance r (P(r)~1/r^(d+alpha_G))
+    from the center of mass of the network, in a random direction (isotropic in
+    d dimensions: a normalized vector of d gaussian numbers), and connects to m
+    different nodes already in the network (or to all of them, while there are
+    fewer than m), node j being chosen with probability proportional to the
+    kernel e_j/r_ij^alpha_A, where e_j is the energy of node j (half the sum of
+    the weights of its edges, node.weight in TN_model_generate).
+    All the random numbers are drawn at once with the numpy Generator made from
+    seed, so a given seed always gives the same network. Returns a dict with the
+    CSR arrays (indptr, indices, weights, see edges_to_csr), the (N, d) array of
+    coordinates and the energies of the nodes.
+    '''
     
-    nk.add_edge(node1, node2, edge12_weight)
-    node1.weight=edge12_weight/2
-    node2.weight=edge12_weight/2
+    rng=np.random.default_rng(seed)
     
-    nk.update_center()
+    links=np.minimum(np.arange(N), m) #number of links of each new node
+    r=pareto_rvs(alpha_G, d, N, rng)
+    directions=rng.standard_normal((N, d))
+    directions/=np.sqrt((directions**2).sum(axis=1))[:,None]
+    edge_weights=stretched_exponential_rvs(links.sum(), rng)
+    u=rng.random((N, m))
     
-    for i in range(2,N):
-        r=alpha_dist.rvs(alpha_G, 2)
-        o=random.uniform(0, 2*np.pi) 
-        nodei_x=nk.center_mass[0]+r*np.cos(o) 
-        nodei_y=nk.center_mass[1]+r*np.sin(o) 
-        nodei=Geo_Node((nodei_x, nodei_y),1)
-        nk.add_node(nodei)
+    coords=np.zeros((N, d))
+    energies=np.zeros(N)
+    heads=np.repeat(np.arange(N), links)
+    tails=np.empty(links.sum(), dtype=np.int64)
+    moment=np.zeros(d) #sum of energy*position of the nodes, for the center of mass
+    total=0.0 #total energy
+    e=0 #edges added so far
+    
+    for i in range(1, N):
+        center=moment/total if total>0 else coords[0]
+        coords[i]=center+r[i]*directions[i]
         
-        connections_list=random.choices(nk.nodes, weights=[node.weight/nk.euclid_distance(nodei, node) for node in nk.nodes], k=1)
+        if links[i]==i: #connects to every node, no need to draw
+            chosen=np.arange(i)
+        else:
+            distances=np.sqrt(((coords[:i]-coords[i])**2).sum(axis=1))
+            chosen=weighted_choice(energies[:i]*distances**(-alpha_A), u[i,:links[i]])
         
-        for connection in connections_list:
-            edgeij_weight=stretched_exponential.rvs()
-            nk.add_edge(nodei, connection, edgeij_weight)
+        w=edge_weights[e:e+links[i]]/2
+        energies[chosen]+=w
+        energies[i]+=w.sum()
+        moment+=w@coords[chosen]+w.sum()*coords[i]
+        total+=2*w.sum()
+        tails[e:e+links[i]]=chosen
+        e+=links[i]
         
-            if nodei.weight==1.0:
-                nodei.weight=edgeij_weight/2
-            
-            else:
-                nodei.weight+=edgeij_weight/2
+    indptr, indices, weights=edges_to_csr(N, heads, tails, edge_weights)
+    
+    return {'indptr': indptr, 'indices': indices, 'weights': weights,
+            'coords': coords, 'energies': energies,
+            'heads': heads, 'tails': tails, 'edge_weights': edge_weights}
+
+def TN_batch_generate(alpha_A, alpha_G, N, R, m=1, d=2, seed=None):
+    '''
+    Generates R independent networks of the TN model at the same time, advancing
+    all of them in lockstep: every step of the growth (placing the new node,
+    computing the kernels and drawing the attachments) is done at once for the R
+    replicas on (R, N) arrays, so for small networks the cost is the arithmetic
+    and not the python overhead of each step. The attachment of each replica is
+    drawn from the cumulative kernel of its row, exactly like in
+    TN_arrays_generate (each replica follows the same model, with the same m and
+    d, but the random numbers are not the same ones TN_arrays_generate would use
+    with the same seed). Returns a dict with the (R, N) array of energies, the
+    (R, N, d) array of coordinates, the (R, E) arrays of attached nodes (tails) and
+    of edge weights (edge_weights) and the heads of the edges, the same for every
+    replica.
+    '''
+    
+    rng=np.random.default_rng(seed)
+    
+    links=np.minimum(np.arange(N), m)
+    r=pareto_rvs(alpha_G, d, (R, N), rng)
+    directions=rng.standard_normal((R, N, d))
+    directions/=np.sqrt((directions**2).sum(axis=2))[:,:,None]
+    edge_weights=stretched_exponential_rvs((R, links.sum()), rng)
+    u=rng.random((R, N, m))
+    
+    replicas=np.arange(R)
+    coords=np.zeros((R, N, d))
+    energies=np.zeros((R, N))
+    heads=np.repeat(np.arange(N), links)
+    tails=np.empty((R, links.sum()), dtype=np.int64)
+    moment=np.zeros((R, d))
+    total=np.zeros(R)
+    e=0
+    
+    for i in range(1, N):
+        center=moment/total[:,None] if i>1 else coords[:,0]
+        coords[:,i]=center+r[:,i,None]*directions[:,i]
+        distances=np.sqrt(((coords[:,:i]-coords[:,i,None])**2).sum(axis=2))
+        kernel=energies[:,:i]*distances**(-alpha_A) if i>1 else np.ones((R, 1))
+        
+        for k in range(links[i]):
+            cumulative=np.cumsum(kernel, axis=1)
+            targets=u[:,i,k]*cumulative[:,-1]
+            chosen=np.minimum((cumulative<=targets[:,None]).sum(axis=1), i-1)
+            kernel[replicas, chosen]=0 #no repeated links
             
-            connection.weight+=edgeij_weight/2
-                
-        for node in nk.nodes:
-            node.update_weight(nk.edges_weights)
-                
+            w=edge_weights[:,e]/2
+            energies[replicas, chosen]+=w
+            energies[:,i]+=w
+            moment+=w[:,None]*(coords[replicas, chosen]+coords[:,i])
+            total+=2*w
+            tails[:,e]=chosen
+            e+=1
             
-        nk.update_center()
-        #print('Iteration', i+1, 'is complete!')
+    return {'energies': energies, 'coords': coords, 'heads': heads,
+            'tails': tails, 'edge_weights': edge_weights}
+
+def TN_model_generate(alpha_A, alpha_G, N, m=1, d=2, seed=None):
+    
+    '''
+    This function will create a network based on a network model presented by 
+    Constantino Tsallis in the paper available in the references text. The model
+    is still unamed, so I named it for the purposes of this code as Tsallis Network
+    model (explaining why TN_model). The parameters alpha are, obviously, the same
+    alphas from the article used as reference, N is the number of iterations,
+    m is the number of links of each new node and d is the dimension of the
+    space where the nodes are placed (2 by default). The network is generated
+    by TN_arrays_generate (take a look at it for the details and the seed) and
+    returned as a Geo_Network, the energy of each node being its weight.
+    '''
+    
+    arrays=TN_arrays_generate(alpha_A, alpha_G, N, m, d, seed)
+    
+    nodes=[Geo_Node(tuple(position), i+1, weight) for i, (position, weight) 
+           in enumerate(zip(arrays['coords'].tolist(), arrays['energies'].tolist()))]
+    
+    nk=Geo_Network()
+    nk.nodes=nodes
+    nk.edges=[(nodes[h], nodes[t]) for h, t in zip(arrays['heads'].tolist(), arrays['tails'].tolist())]
+    nk.edges_weights=dict(zip(nk.edges, arrays['edge_weights'].tolist()))
+    nk.update_center()
     
     return nk
 
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module computes the structural statistics of the networks (degree and
+strength distributions, strength-degree correlation, edge lengths and clustering)
+directly from the arrays of the network in CSR format (see NetworkStore.py),
+without converting anything to networkx. The results of each network are kept
+in a NetworkSummary, made only of histograms with fixed bins and sums of powers
+(moments), so the summaries of many realizations, computed in different workers,
+can simply be added together.
+"""
+
+import numpy as np
+from scipy import sparse
+
+#fixed bins of the histograms, they have to be the same for every realization
+#so the summaries can be merged:
+default_bins={'strength': np.logspace(-4, 4, 81),
+              'edge_length': np.logspace(-1, 7, 81),
+              'clustering': np.linspace(0, 1, 21)}
+
+def csr_rows(indptr):
+    #the node (row) of each entry of the CSR arrays
+
+    return np.repeat(np.arange(len(indptr)-1), np.diff(indptr))
+
+def degrees(indptr, indices):
+    '''
+    Degree of every node. A self loop is stored only once in the CSR arrays (see
+    NetworkGeneration.edges_to_csr), but it counts twice in the degree, like in
+    networkx (hubs_generate can create self loops when it rewires the edges).
+    '''
+
+    rows=csr_rows(indptr)
+    loops=np.bincount(rows[rows==np.asarray(indices)], minlength=len(indptr)-1)
+
+    return np.diff(indptr)+loops
+
+def strengths(indptr, indices, weights):
+    #the strength of a node is the sum of the weights of its edges (self loops
+    #count twice, like in degrees)
+
+    rows=csr_rows(indptr)
+    weights=np.asarray(weights)*np.where(rows==np.asarray(indices), 2, 1)
+
+    return np.bincount(rows, weights=weights, minlength=len(indptr)-1)
+
+def edge_lengths(indptr, indices, coords):
+    '''
+    Euclidean length of every edge of the network (each edge counted only once,
+    self loops are left out), coords being the (N, d) array of positions.
+    '''
+
+    rows=csr_rows(indptr)
+    once=rows<indices
+
+    return np.linalg.norm(coords[rows[once]]-coords[indices[once]], axis=1)
+
+def clustering(indptr, indices):
+    '''
+    Local clustering coefficient of every node, c_i=2t_i/(k_i(k_i-1)), where t_i is
+    the number of triangles through node i, computed with sparse matrix products
+    (t_i is half the i-th diagonal element of A^3). Self loops and repeated edges
+    are ignored and nodes with degree smaller than 2 get c=0, like in networkx.
+    '''
+
+    n=len(indptr)-1
+    rows=csr_rows(indptr)
+    mask=rows!=np.asarray(indices)
+
+    A=sparse.csr_matrix((np.ones(mask.sum()), (rows[mask], np.asarray(indices)[mask])), shape=(n, n))
+    A.sum_duplicates()
+    A.data[:]=1
+
+    k=np.diff(A.indptr)
+    triangles=np.asarray((A@A).multiply(A).sum(axis=1)).ravel()/2
+    c=np.zeros(n)
+    c[k>1]=2*triangles[k>1]/(k[k>1]*(k[k>1]-1))
+
+    return c
+
+def same_bins(bins, other):
+    #True if the two bins are equal (or both None, for the degree indexed histograms)
+
+    if bins is None or other is None:
+        return bins is None and other is None
+
+    return np.array_equal(bins, other)
+
+class NetworkSummary:
+    '''
+    Mergeable summary of the statistics of one or many networks. histograms is a
+    dict of arrays of counts (with the bins of the same name in bins, or indexed
+    by the degree itself when the bins are None), outside keeps, for the binned
+    histograms, the counts [below the first bin, above the last bin], so nothing
+    is lost, and moments is a dict of arrays [count, sum, sum of squares]. Two
+    summaries are merged with +, which simply adds everything, so a summary of
+    an ensemble doesn't depend on the order in which the realizations finished.
+    Merging summaries whose histograms have different bins raises ValueError.
+    '''
+
+    def __init__(self, bins=default_bins):
+
+        self.realizations=0
+        self.bins=dict(bins)
+        self.histograms={}
+        self.outside={}
+        self.moments={}
+
+    def add_histogram(self, name, counts, bins=None):
+        #adds counts to the histogram name, which must have the same bins (None
+        #for the degree indexed ones), otherwise the counts wouldn't match
+
+        if name in self.histograms and not same_bins(self.bins.get(name), bins):
+            raise ValueError('The histograms '+name+' have different bins and cannot be merged')
+
+        self.bins[name]=bins
+
+        if name in self.histograms: #degree indexed histograms may have different lengths
+            old=self.histograms[name]
+            size=max(len(old), len(counts))
+            merged=np.zeros(size)
+            merged[:len(old)]+=old
+            merged[:len(counts)]+=counts
+            self.histograms[name]=merged
+
+        else:
+            self.histograms[name]=np.asarray(counts, dtype=np.float64)
+
+    def add_values(self, name, values, bins):
+        #histogram of values with the given bins, keeping the values out of them
+
+        values=np.asarray(values)
+        self.add_histogram(name, np.histogram(values, bins=bins)[0], bins)
+        self.outside[name]=self.outside.get(name, np.zeros(2))+np.array([(values<bins[0]).sum(),
+                                                                          (values>bins[-1]).sum()])
+
+    def add_moments(self, name, values):
+
+        values=np.asarray(values, dtype=np.float64)
+        new=np.array([len(values), values.sum(), (values**2).sum()])
+        self.moments[name]=self.moments.get(name, np.zeros(3))+new
+
+    def __add__(self, other):
+
+        merged=NetworkSummary(self.bins)
+        merged.realizations=self.realizations+other.realizations
+
+        for summary in (self, other):
+            for name in summary.histograms:
+                merged.add_histogram(name, summary.histograms[name], summary.bins.get(name))
+            for name in summary.outside:
+                merged.outside[name]=merged.outside.get(name, np.zeros(2))+summary.outside[name]
+            for name in summary.moments:
+                merged.moments[name]=merged.moments.get(name, np.zeros(3))+summary.moments[name]
+
+        return merged
+
+    def mean(self, name):
+
+        count, s1, s2=self.moments[name]
+
+        return s1/count
+
+    def std(self, name):
+
+        count, s1, s2=self.moments[name]
+
+        return np.sqrt(max(s2/count-(s1/count)**2, 0))
+
+    def density(self, name):
+        '''
+        Returns (bins, density) for the histogram name (for the degree, P(k) for
+        k=0,1,...). The density is normalized by all the values, including the
+        ones out of the bins, so it integrates to the fraction of values inside
+        the bins and the densities of merged summaries are not biased.
+        '''
+
+        counts=self.histograms[name]
+        bins=self.bins.get(name)
+
+        if bins is None:
+            return np.arange(len(counts)), counts/counts.sum()
+
+        total=counts.sum()+self.outside.get(name, np.zeros(2)).sum()
+
+        return bins, counts/(total*np.diff(bins))
+
+    def strength_by_degree(self):
+        '''
+        Returns (k, <s>(k)), the mean strength of the nodes with degree k, for the
+        degrees that appear in the networks.
+        '''
+
+        counts=self.histograms['degree']
+        sums=self.histograms['strength_by_degree']
+        k=np.nonzero(counts[:len(sums)])[0]
+
+        return k, sums[k]/counts[k]
+
+def network_statistics(indptr, indices, weights=None, coords=None, bins=default_bins):
+    '''
+    Computes the NetworkSummary of one network given by its CSR arrays. weights
+    are the weights of the entries of indices (without them the network is taken
+    as unweighted and the strength is the degree) and coords is the (N, d) array
+    of positions, without it the edge lengths are not computed (hubs networks, for
+    example, have no positions).
+    '''
+
+    indptr=np.asarray(indptr)
+    indices=np.asarray(indices)
+    summary=NetworkSummary(bins)
+    summary.realizations=1
+
+    k=degrees(indptr, indices)
+    s=k.astype(np.float64) if weights is None else strengths(indptr, indices, weights)
+    c=clustering(indptr, indices)
+
+    summary.add_histogram('degree', np.bincount(k))
+    summary.add_histogram('strength_by_degree', np.bincount(k, weights=s))
+    summary.add_values('strength', s, bins['strength'])
+    summary.add_values('clustering', c, bins['clustering'])
+    summary.add_moments('degree', k)
+    summary.add_moments('strength', s)
+    summary.add_moments('clustering', c)
+
+    if coords is not None:
+        lengths=edge_lengths(indptr, indices, np.asarray(coords))
+        summary.add_values('edge_length', lengths, bins['edge_length'])
+        summary.add_moments('edge_length', lengths)
+
+    return summary
+
+def stored_statistics(network, bins=default_bins):
+    #the NetworkSummary of a NetworkStore.StoredNetwork (or of its arrays dict)
+
+    arrays=network if isinstance(network, dict) else network.arrays
+
+    return network_statistics(arrays['indptr'], arrays['indices'], arrays.get('weights'),
+                              arrays.get('coords'), bins)
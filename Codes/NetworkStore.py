@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module stores the networks generated with the NetworkGeneration.py module
+on disk, so that a network generated once with a given set of parameters and a
+given seed never has to be generated again, neither in a new run nor in another
+process. Every network is saved as a folder of .npy files, with the edges in CSR
+(compressed sparse row) format, and a small .json file with the generation
+parameters. The arrays are loaded back with memory mapping, so many workers can
+read the same big network at the same time without copying or unpickling it.
+"""
+
+import os
+import json
+import hashlib
+import random
+import shutil
+import tempfile
+import numpy as np
+import networkx as nx
+import NetworkGeneration as ng
+
+#default folder of the store, next to the codes (it is ignored by git):
+store_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'network_store')
+
+#version of what is saved for each network, part of its key, so networks saved
+#by older versions (the hubs ones without parent and generation, for example)
+#are generated again instead of being loaded:
+store_version=2
+
+def canonical(value):
+    #numbers (python or numpy, except booleans) become floats
+
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+
+    return value
+
+def json_number(value):
+    #default of json.dump, for the numpy numbers in the params of a network
+
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+
+    raise TypeError('Object of type '+type(value).__name__+' is not JSON serializable')
+
+def network_key(model, seed, **params):
+    '''
+    Returns the name under which a network is stored: the name of the model
+    followed by a hash of the generation parameters and the seed, so the same
+    network always gets the same key, no matter the order of the parameters. The
+    numeric parameters are hashed as floats, so alpha_A=2 and alpha_A=2.0 (or a
+    numpy number) give the same key. store_version is hashed too.
+    '''
+
+    params={name: canonical(params[name]) for name in params}
+    text=json.dumps({'model': model, 'seed': int(seed), 'params': params,
+                     'version': store_version}, sort_keys=True)
+
+    return model+'_'+hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def seed_generators(seed):
+    '''
+    hubs_generate draws from the global random state, so it has to be seeded to
+    make those networks reproducible from their seed. numpy's global state is
+    seeded too, for any code that still draws from it (the TN networks take the
+    seed directly, see NetworkGeneration.TN_arrays_generate).
+    '''
+
+    random.seed(seed)
+    np.random.seed(seed)
+
+def hubs_to_arrays(nk):
+    '''
+    Converts a networkx graph (like the ones made by hubs_generate) to the arrays
+    saved in the store. The labels of the nodes are kept in the order of nk.nodes,
+    so the graph rebuilt from the store is the same, labels included. The parent
+    and generation arrays recorded by hubs_generate are saved too.
+    '''
+
+    labels=list(nk.nodes)
+    index={label:i for i, label in enumerate(labels)}
+    edges=np.array([(index[u], index[v]) for u, v in nk.edges], dtype=np.int64).reshape(-1, 2)
+    indptr, indices, weights=ng.edges_to_csr(len(labels), edges[:,0], edges[:,1])
+
+    arrays={'indptr': indptr, 'indices': indices, 'weights': weights,
+            'labels': np.array(labels, dtype=np.int64)}
+
+    for name in ('parent', 'generation'): #generation metadata of hubs_generate
+        if name in nk.graph:
+            arrays[name]=nk.graph[name]
+
+    return arrays
+
+#arrays saved for the TN networks:
+TN_arrays=('indptr', 'indices', 'weights', 'coords', 'energies')
+
+class StoredNetwork:
+    '''
+    A network loaded from the store. Every array saved for the network is an
+    attribute of the object with the same name (indptr, indices, weights, and,
+    depending on the model, labels, coords and energies), and params is the dict
+    with the generation parameters. When loaded with memory mapping, the arrays
+    are read-only views of the files on disk.
+    '''
+
+    def __init__(self, arrays, params):
+
+        self.params=params
+
+        for name in arrays:
+            setattr(self, name, arrays[name])
+
+        self.arrays=arrays
+
+    def number_of_nodes(self):
+
+        return len(self.indptr)-1
+
+    def degrees(self):
+        #entries of each row of the CSR arrays (a self loop is stored only once,
+        #see NetworkStatistics.degrees for the degree as networkx counts it)
+
+        return np.diff(self.indptr)
+
+    def to_networkx(self):
+        '''
+        Rebuilds the network as a networkx graph (with the original labels, if
+        they were stored), for the codes that still need networkx, like the
+        Simulation function of CitiesInfection.py. For the hubs networks, the
+        parent, generation and ancestors of hubs_generate are put back in nk.graph.
+        '''
+
+        n=self.number_of_nodes()
+        labels=self.labels if 'labels' in self.arrays else np.arange(n)
+        rows=np.repeat(np.arange(n), self.degrees())
+
+        nk=nx.Graph()
+        nk.add_nodes_from(labels.tolist())
+        nk.add_edges_from(zip(labels[rows].tolist(), labels[self.indices].tolist()))
+
+        if 'parent' in self.arrays and 'generation' in self.arrays:
+            nk.graph['parent']=np.array(self.parent)
+            nk.graph['generation']=np.array(self.generation)
+            nk.graph['ancestors']=ng.hubs_ancestors(nk.graph['parent'], nk.graph['generation'])
+
+        return nk
+
+class NetworkStore:
+    '''
+    This class takes care of the folder where the networks are stored. Each network
+    is saved in a subfolder named by its key (see network_key), and a network is
+    only generated when its key is not in the store yet, so any process (or any
+    future run) asking for the same parameters and seed gets the stored network.
+    '''
+
+    def __init__(self, path=store_path):
+
+        self.path=path
+        os.makedirs(self.path, exist_ok=True)
+
+    def __contains__(self, key):
+
+        return os.path.isfile(os.path.join(self.path, key, 'params.json'))
+
+    def save(self, key, arrays, params):
+        '''
+        Saves the arrays (a dict of numpy arrays) and the params (a dict of json
+        values, numpy numbers included) under key. Everything is first written to
+        a temporary folder and then renamed, so a worker never reads a half written
+        network, and if two workers save the same network at the same time, only
+        one is kept. If anything fails, the temporary folder is removed.
+        '''
+
+        tmp=tempfile.mkdtemp(dir=self.path, prefix='.tmp_')
+
+        try:
+            for name in arrays:
+                np.save(os.path.join(tmp, name+'.npy'), np.ascontiguousarray(arrays[name]))
+
+            with open(os.path.join(tmp, 'params.json'), 'w') as file:
+                json.dump(params, file, sort_keys=True, default=json_number)
+
+        except BaseException:
+            shutil.rmtree(tmp)
+            raise
+
+        try:
+            os.rename(tmp, os.path.join(self.path, key))
+        except OSError: #the network was saved by someone else in the meantime
+            shutil.rmtree(tmp)
+
+    def load(self, key, mmap=True):
+        '''
+        Loads the network saved under key as a StoredNetwork. If mmap is True the
+        arrays are memory mapped (read-only and shared between processes), otherwise
+        they are read into memory.
+        '''
+
+        folder=os.path.join(self.path, key)
+
+        with open(os.path.join(folder, 'params.json')) as file:
+            params=json.load(file)
+
+        arrays={}
+        for file_name in sorted(os.listdir(folder)):
+            if file_name.endswith('.npy'):
+                arrays[file_name[:-4]]=np.load(os.path.join(folder, file_name),
+                                               mmap_mode='r' if mmap else None)
+
+        return StoredNetwork(arrays, params)
+
+    def hubs(self, p=0.7, m=3, N=2, seed=0, mmap=True):
+        '''
+        Returns the hubs_generate network with parameters p, m and N generated with
+        the given seed, generating and saving it first if it is not stored yet.
+        '''
+
+        key=network_key('hubs', seed, p=p, m=m, N=N)
+
+        if key not in self:
+            state=random.getstate(), np.random.get_state() #the caller's random state is kept
+            seed_generators(seed)
+            try:
+                nk=ng.hubs_generate(p, m, N)
+            finally:
+                random.setstate(state[0])
+                np.random.set_state(state[1])
+            self.save(key, hubs_to_arrays(nk), {'model': 'hubs', 'seed': seed,
+                                                'p': p, 'm': m, 'N': N})
+
+        return self.load(key, mmap)
+
+    def TN(self, alpha_A, alpha_G, N, seed=0, m=1, d=2, mmap=True):
+        '''
+        Returns the TN model network with parameters alpha_A, alpha_G, N, m and d
+        generated with the given seed (see NetworkGeneration.TN_arrays_generate),
+        generating and saving it first if it is not stored yet.
+        '''
+
+        key=network_key('TN', seed, alpha_A=alpha_A, alpha_G=alpha_G, N=N, m=m, d=d)
+
+        if key not in self:
+            arrays=ng.TN_arrays_generate(alpha_A, alpha_G, N, m, d, seed)
+            self.save(key, {name: arrays[name] for name in TN_arrays},
+                      {'model': 'TN', 'seed': seed, 'alpha_A': alpha_A,
+                       'alpha_G': alpha_G, 'N': N, 'm': m, 'd': d})
+
+        return self.load(key, mmap)
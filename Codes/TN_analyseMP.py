@@ -7,11 +7,14 @@ Created on Wed Apr  7 22:52:59 2021
 """
 
 import NetworkGeneration as ng
+import NetworkStore as ns
+import NetworkStatistics as nst
 from matplotlib import pyplot as plt
 import time
 import numpy as np
 from scipy.optimize import curve_fit
 import multiprocessing as mp
+import random
 
 '''
 This code will be used to test and analyse data from the TN_model_generate function
@@ -23,30 +26,283 @@ why I'm making a separate code here in case you want to work with a more efficie
 version of the analysis code.
 '''
 
-def simular(n, alpha_A, alpha_G, N):
+def stored_energies(alpha_A, alpha_G, N, seed, path, m=1, d=2):
+    '''
+    Returns the energies of the TN network with the given parameters and seed
+    from the network store in path (generating and storing it first if needed).
+    Only this array goes back to the main process, not the whole network.
+    '''
+    
+    store=ns.NetworkStore(path)
+    
+    return np.array(store.TN(alpha_A, alpha_G, N, seed, m, d).energies)
+
+def simular(n, alpha_A, alpha_G, N, store_path=None):
     '''
     This will create n networks with the TN_model, using the parameters shown,
     and print the graph of p(e) x e where p(e) is the probability to find a node 
-    with energy e in the final network.
+    with energy e in the final network. If store_path is given (for example
+    ns.store_path), the realizations use the seeds 0 to n-1 and are kept in the
+    network store in that folder, so running the same analysis again only loads
+    the networks instead of generating them.
     '''
     
     cores=mp.cpu_count()
-    pool=mp.Pool(processes=cores)
-    energies=[]
-    pool_list=[]
-    
-    for i in range(n):
-        p=pool.apply_async(ng.TN_model_generate, (alpha_A, alpha_G, N))
-        pool_list.append(p)
-        #print('Simulation', 100*len(pool_list)/n, '% completed!')
+    with mp.Pool(processes=cores) as pool:
+        energies=[]
+        pool_list=[]
+    
+        if store_path is not None:
+            for i in range(n):
+                p=pool.apply_async(stored_energies, (alpha_A, alpha_G, N, i, store_path))
+                pool_list.append(p)
+            
+            for p in pool_list:
+                energies+=list(p.get())
+            
+            return energies
+    
+        for i in range(n):
+            p=pool.apply_async(ng.TN_model_generate, (alpha_A, alpha_G, N))
+            pool_list.append(p)
+            #print('Simulation', 100*len(pool_list)/n, '% completed!')
             
-    networks=[p.get() for p in pool_list]
+        networks=[p.get() for p in pool_list]
     
     for nk in networks:
         energies+=[node.weight for node in nk.nodes]
     
     return energies
 
+def realization_statistics(model, params, seed, store_path=None):
+    '''
+    Worker of simular_estatisticas: generates (or loads, if store_path is given)
+    one network of the model ('TN' for TN_model_generate or 'hubs' for
+    hubs_generate) with the parameters in the params dict and the given seed, and
+    returns its energies (None for hubs networks) and its NetworkSummary, computed
+    directly from the CSR arrays of the network.
+    '''
+    
+    if store_path is not None:
+        store=ns.NetworkStore(store_path)
+        arrays=getattr(store, model)(seed=seed, **params).arrays
+        
+    elif model=='TN':
+        arrays=ng.TN_arrays_generate(seed=seed, **params)
+        
+    else:
+        ns.seed_generators(seed)
+        arrays=ns.hubs_to_arrays(ng.hubs_generate(**params))
+            
+    energies=np.array(arrays['energies']) if 'energies' in arrays else None
+    
+    return energies, nst.stored_statistics(arrays)
+
+def simular_estatisticas(n, model='TN', store_path=None, **params):
+    '''
+    Same as simular, but every worker also computes the structural statistics of
+    its network (see NetworkStatistics.py), so this returns the list of energies
+    and the NetworkSummary of the whole ensemble, for example:
+    energies, summary=simular_estatisticas(100, alpha_A=2, alpha_G=1, N=1000)
+    or, for the hubs networks, simular_estatisticas(100, 'hubs', p=0.5, m=2, N=3).
+    The realizations use the seeds 0 to n-1 when store_path is given, and random
+    seeds otherwise.
+    '''
+    
+    cores=mp.cpu_count()
+    with mp.Pool(processes=cores) as pool:
+        energies=[]
+        summary=nst.NetworkSummary()
+        pool_list=[]
+    
+        for i in range(n):
+            seed=i if store_path is not None else random.randrange(2**32)
+            p=pool.apply_async(realization_statistics, (model, params, seed, store_path))
+            pool_list.append(p)
+        
+        for p in pool_list:
+            realization_energies, realization_summary=p.get()
+            summary=summary+realization_summary
+            if realization_energies is not None:
+                energies+=list(realization_energies)
+            
+    return energies, summary
+
+def TN_energies(alpha_A, alpha_G, N, seed, m=1, d=2):
+    #worker of simular_adaptativo when the networks are not stored
+    
+    return ng.TN_arrays_generate(alpha_A, alpha_G, N, m, d, seed)['energies']
+
+def TN_batch_energies(alpha_A, alpha_G, N, R, seed, m=1, d=2):
+    #worker that generates R networks at once, returns the (R, N) array of energies
+    
+    return ng.TN_batch_generate(alpha_A, alpha_G, N, R, m, d, seed)['energies']
+
+def simular_lotes(n, alpha_A, alpha_G, N, R=100, m=1, d=2):
+    '''
+    Same as simular, but each task of the pool generates R networks at once with
+    NetworkGeneration.TN_batch_generate, which is much faster when we need
+    thousands of small networks (N~100), since the time of each network is then
+    mostly python overhead. Returns the list of energies of the n realizations.
+    '''
+    
+    cores=mp.cpu_count()
+    with mp.Pool(processes=cores) as pool:
+        energies=[]
+        pool_list=[]
+    
+        for start in range(0, n, R):
+            p=pool.apply_async(TN_batch_energies, (alpha_A, alpha_G, N, min(R, n-start), 
+                                                   random.randrange(2**32), m, d))
+            pool_list.append(p)
+        
+        for p in pool_list:
+            energies+=list(p.get().ravel())
+        
+    return energies
+
+#fixed logarithmic bins of the energy histograms of simular_adaptativo; the
+#histograms also have a first bin for the energies below them and a last one
+#for the energies above them, so no energy is left out of the quantiles:
+energy_bins=np.logspace(-4, 3, 71)
+histogram_bins=np.concatenate(([-np.inf], energy_bins, [np.inf]))
+
+def q_dist(x, q, bq, Z):
+    
+    return 1/Z*(1-bq*(1-q)*x)**(1/(1-q))
+
+def tail_error(histograms, tail=(0.9, 0.999)):
+    '''
+    histograms is the (n, bins) array with the energy histogram of each of the n
+    realizations (with histogram_bins). The tail of P(\u03B5) is made of the bins
+    between the quantiles tail[0] and tail[1] of the energies, and this returns
+    the largest relative error (standard error of the mean over the realizations
+    divided by the mean) among those bins. Using the spread between realizations,
+    instead of the number of counts, takes into account that the energies of the
+    nodes of the same network are not independent. The error of a bin is never
+    taken smaller than the Poisson error of its counts, since a few realizations
+    can agree by chance. If no bin is in the tail, the error is infinite.
+    '''
+    
+    n=len(histograms)
+    total=histograms.sum(axis=0)
+    upper=np.cumsum(total)/total.sum() #fraction of energies up to the end of each bin
+    lower=upper-total/total.sum() #and up to the start of each bin
+    in_tail=(upper>tail[0])&(lower<tail[1])&(total>0)
+    
+    if not in_tail.any():
+        return np.inf
+    
+    mean=histograms[:,in_tail].mean(axis=0)
+    error=np.maximum(histograms[:,in_tail].std(axis=0, ddof=1)/np.sqrt(n),
+                     np.sqrt(total[in_tail])/n) #Poisson floor
+    
+    return np.max(error/mean)
+
+def q_error(histograms, bins=energy_bins):
+    '''
+    Fits the q-exponential q_dist to the log-binned P(\u03B5) of the realizations
+    in histograms (weighting each bin by its standard error over the realizations,
+    and normalizing by all the energies, even the ones out of the bins) and
+    returns the parameters (q, bq, Z) and the relative error of q. As in
+    tail_error, the error of a bin is at least the Poisson error of its counts
+    (of one count, for the bins where all the realizations agree on zero), so no
+    bin is dropped or trusted too much. If the fit doesn't converge, the error is
+    infinite.
+    '''
+    
+    n=len(histograms)
+    widths=np.diff(bins)
+    size=histograms.sum(axis=1).mean() #mean number of energies of a realization
+    densities=histograms[:,1:-1]/(size*widths)
+    density=densities.mean(axis=0)
+    poisson=np.sqrt(np.maximum(histograms[:,1:-1].sum(axis=0), 1))/(n*size*widths)
+    sigma=np.maximum(densities.std(axis=0, ddof=1)/np.sqrt(n), poisson)
+    mids=np.sqrt(bins[1:]*bins[:-1])
+    good=density>0
+    
+    try:
+        parameters, cov_matrix=curve_fit(q_dist, mids[good], density[good], p0=(1.1, 1, 1),
+                                         sigma=sigma[good], absolute_sigma=True,
+                                         bounds=([1.0001, 0, 0], [3, np.inf, np.inf]))
+    except (RuntimeError, ValueError):
+        return (np.nan, np.nan, np.nan), np.inf
+    
+    return tuple(parameters), np.sqrt(cov_matrix[0,0])/parameters[0]
+
+def simular_adaptativo(alpha_A, alpha_G, N, rel_error=0.05, criterion='tail', 
+                       tail=(0.9, 0.999), wave=None, max_n=10000, store_path=None,
+                       verbose=True, m=1, d=2, batch=1, min_n=20):
+    '''
+    Instead of a fixed number n of realizations, this launches the realizations in
+    waves (of size wave, the number of cores by default) and stops when the
+    relative error rel_error is reached, either on the tail bins of P(\u03B5) (if
+    criterion is 'tail', see tail_error) or on the fitted q (if criterion is 'q',
+    see q_error), or when max_n realizations were made. Since the error of a few
+    realizations is itself unreliable, it only stops after at least min_n
+    realizations and once the error was reached on two consecutive waves. Returns the list of
+    energies and a dict reporting the number of realizations used, the achieved
+    errors, the fitted (q, bq, Z) and whether the required precision was reached.
+    With store_path, realization i uses seed i and is kept in the network store.
+    m and d are the number of links of each new node and the dimension of the
+    networks (see NetworkGeneration.TN_arrays_generate). If batch is bigger than
+    1 (and the networks are not stored), each task generates batch realizations
+    at once with TN_batch_generate, which is faster for small networks.
+    max_n has to be at least 2, to have an error, and at least min_n.
+    '''
+    
+    if criterion not in ('tail', 'q'):
+        raise ValueError("criterion has to be 'tail' or 'q', not "+repr(criterion))
+    
+    if max_n<max(min_n, 2):
+        raise ValueError('max_n has to be at least 2 and min_n, not '+str(max_n))
+    
+    cores=mp.cpu_count()
+    with mp.Pool(processes=cores) as pool:
+        wave=cores if wave is None else wave
+        energies=[]
+        histograms=[]
+        passed=0 #consecutive waves with the error reached
+    
+        while len(histograms)<max_n:
+            start=len(histograms)
+            size=min(max(wave, 2) if start==0 else wave, max_n-start) #at least 2 to have an error
+            pool_list=[]
+        
+            for i in range(start, start+size, batch if store_path is None else 1):
+                if store_path is not None:
+                    p=pool.apply_async(stored_energies, (alpha_A, alpha_G, N, i, store_path, m, d))
+                elif batch>1:
+                    p=pool.apply_async(TN_batch_energies, (alpha_A, alpha_G, N, min(batch, start+size-i),
+                                                           random.randrange(2**32), m, d))
+                else:
+                    p=pool.apply_async(TN_energies, (alpha_A, alpha_G, N, random.randrange(2**32), m, d))
+                pool_list.append(p)
+            
+            for p in pool_list:
+                for realization in np.atleast_2d(p.get()):
+                    energies+=list(realization)
+                    histograms.append(np.histogram(realization, bins=histogram_bins)[0])
+            
+            counts=np.array(histograms)
+            achieved=tail_error(counts, tail) if criterion=='tail' else q_error(counts)[1]
+        
+            if verbose:
+                print('Realizations:', len(histograms), '| relative error:', achieved)
+            
+            passed=passed+1 if achieved<=rel_error else 0
+            
+            if passed>=2 and len(histograms)>=min_n:
+                break
+        
+    counts=np.array(histograms)
+    parameters, q_rel_error=q_error(counts)
+    report={'realizations': len(histograms), 'tail_error': float(tail_error(counts, tail)),
+            'q': float(parameters[0]), 'bq': float(parameters[1]), 'Z': float(parameters[2]),
+            'q_error': float(q_rel_error), 'converged': bool(passed>=2 and len(histograms)>=min_n)}
+    
+    return energies, report
+
 def analisar(energy_list, bins, q_fit=False): 
     
     #REVIEW AND FIX THIS PART OF THE CODE!¨